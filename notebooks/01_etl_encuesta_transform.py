@@ -33,6 +33,22 @@ from typing import Dict, Tuple, List
 import warnings
 from IPython.display import display
 
+# numba es opcional: si está instalado, la clasificación de transporte
+# se compila a código nativo; si no, se usa la ruta numpy vectorizada
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# polars es opcional: habilita la ruta perezosa del transform (ver
+# USE_POLARS más abajo); sin él se usa la ruta pandas equivalente
+try:
+    import polars as pl
+    HAS_POLARS = True
+except ImportError:
+    HAS_POLARS = False
+
 # Configuración
 pd.set_option('display.max_columns', None)
 pd.set_option('future.no_silent_downcasting', True)
@@ -49,6 +65,21 @@ DATA_DIR = Path("../data")
 INPUT_FILE = DATA_DIR / "encuesta_procesada.xlsx"
 OUTPUT_FILE = DATA_DIR / "encuesta_tansformada.xlsx"
 
+# I/O rápido: lector calamine (Rust) y escritor xlsxwriter + Parquet.
+# Poner en False para volver a la ruta openpyxl pura (solo pandas+openpyxl).
+FAST_IO = True
+
+# Ruta Polars: expresa el transform fila a fila (filtros, clasificaciones,
+# agregados de transporte/alimentación/compras) como un plan perezoso que
+# el optimizador fusiona y materializa una sola vez. Poner en False (o no
+# instalar polars) para usar la ruta pandas paso a paso equivalente.
+USE_POLARS = True
+
+# Previews y distribuciones intermedias: formatear cada celda del frame
+# (value_counts, to_string, display) cuesta una pasada Python completa,
+# así que solo se emiten al depurar. Las líneas de estado "✓" se mantienen.
+VERBOSE = False
+
 # Parámetros de negocio
 CONFIG = {
     "complete_survey_last_page": 7,
@@ -60,6 +91,64 @@ CONFIG = {
     "foreign_code": "Extranjero"
 }
 
+# Columnas que el pipeline realmente utiliza: limitar el parseo del xlsx
+# a estas columnas reduce eventos XML, coerciones de tipo y memoria
+REQUIRED_COLS = [
+    # Identificación y filtrado
+    "Última página", "Fecha de inicio", "alojamiento",
+    # Procedencia
+    "residencia", "pais", "provincia",
+    # Estancia y distancia
+    "noches_valencia", "dist_km",
+    # Transporte (congreso y ocio)
+    *[f"uso_{modo}_{ctx}"
+      for modo in ("bus", "metro", "taxi", "coche", "bici", "pie")
+      for ctx in ("congreso", "ocio")],
+    # Alimentación
+    *[f"carne_roja_{lugar}" for lugar in ("restaurante", "fastfood", "domicilio", "casera")],
+    *[f"avepescado_{lugar}" for lugar in ("restaurante", "fastfood", "domicilio", "casera")],
+    *[f"marisco_{lugar}" for lugar in ("restaurante", "domicilio", "casera")],
+    # Compras
+    *[f"compras_{tipo}_cantidad" for tipo in ("textiles", "artesania", "alimentacion", "souvenirs")],
+]
+
+# Agregación de alimentación por tipo de alimento
+FOOD_TYPES = {
+    "carne_roja": ["carne_roja_restaurante", "carne_roja_fastfood",
+                   "carne_roja_domicilio", "carne_roja_casera"],
+    "avepescado": ["avepescado_restaurante", "avepescado_fastfood",
+                   "avepescado_domicilio", "avepescado_casera"],
+    "marisco": ["marisco_restaurante", "marisco_domicilio", "marisco_casera"]
+}
+
+# Agregación de alimentación por lugar de consumo
+PLACE_TYPES = {
+    "restaurante": ["carne_roja_restaurante", "avepescado_restaurante", "marisco_restaurante"],
+    "fastfood": ["carne_roja_fastfood", "avepescado_fastfood"],
+    "domicilio": ["carne_roja_domicilio", "avepescado_domicilio", "marisco_domicilio"],
+    "casera": ["carne_roja_casera", "avepescado_casera", "marisco_casera"]
+}
+
+# Columnas de cantidad de compras
+SHOPPING_COLS = [
+    "compras_textiles_cantidad",
+    "compras_artesania_cantidad",
+    "compras_alimentacion_cantidad",
+    "compras_souvenirs_cantidad"
+]
+
+# Consolidación de tipos de alojamiento para las métricas de noches;
+# los tipos no listados conservan su propio nombre
+ACCOMMODATION_BUCKETS = {
+    "Alojamiento local sin coste": "Airbnb",
+    "Apartamento de alquiler (AirBnb)": "Airbnb",
+    "Hotel 2 estrellas": "Pension o Hostal",
+    "Pensión o hostal": "Pension o Hostal",
+    "Hotel 3 estrellas": "Hotel 3 estrellas",
+    "Hotel 4 estrellas": "Hotel 4 estrellas",
+    "Hotel 5 estrellas": "Hotel 5 estrellas"
+}
+
 # %% [markdown]
 """
 ## 3. Funciones de Utilidad
@@ -82,14 +171,47 @@ def load_survey_data(file_path: Path) -> pd.DataFrame:
     """
     if not file_path.exists():
         raise FileNotFoundError(f"Archivo no encontrado: {file_path}")
-    
+
+    # Cache Parquet: el parseo del xlsx es el paso más lento del notebook,
+    # así que tras la primera lectura se guarda un .parquet hermano y las
+    # ejecuciones siguientes lo leen directamente (si no quedó obsoleto)
+    cache = file_path.with_suffix(".parquet")
+    if FAST_IO and cache.exists() and cache.stat().st_mtime >= file_path.stat().st_mtime:
+        df = pd.read_parquet(cache)
+        print(f"✓ Datos cargados desde cache Parquet: {df.shape[0]} filas, {df.shape[1]} columnas")
+        return df
+
+    # usecols como callable: no falla si alguna columna (p.ej. dist_km)
+    # todavía no existe en la encuesta, simplemente se omite
+    required = set(REQUIRED_COLS)
+    usecols = lambda col: col in required  # noqa: E731
+
     try:
-        df = pd.read_excel(file_path)
+        if FAST_IO:
+            try:
+                # calamine parsea el XML en streaming (Rust), ~5-20x vs openpyxl
+                df = pd.read_excel(file_path, engine="calamine", usecols=usecols)
+            except ImportError:
+                print("⚠ python-calamine no instalado, usando lector por defecto")
+                df = pd.read_excel(file_path, usecols=usecols)
+        else:
+            df = pd.read_excel(file_path, usecols=usecols)
         print(f"✓ Datos cargados: {df.shape[0]} filas, {df.shape[1]} columnas")
-        return df
     except Exception as e:
         raise ValueError(f"Error al cargar el archivo: {e}")
 
+    if FAST_IO:
+        # Mejor esfuerzo: columnas object con tipos mezclados (p.ej.
+        # noches_valencia con texto libre) no son convertibles a Arrow,
+        # y un cache fallido nunca debe tumbar la carga
+        try:
+            df.to_parquet(cache, index=False)
+            print(f"✓ Cache Parquet escrito: {cache.name}")
+        except Exception as e:
+            print(f"⚠ No se pudo escribir el cache Parquet, se omite: {e}")
+
+    return df
+
 
 def validate_data(df: pd.DataFrame) -> None:
     """
@@ -116,67 +238,128 @@ def validate_data(df: pd.DataFrame) -> None:
     print("✓ Validación de datos completada")
 
 
-def classify_visitor_type1(row: pd.Series) -> str:
+def _extract_soa(df: pd.DataFrame, cols: List[str], dtype=None) -> Dict[str, np.ndarray]:
     """
-    Clasifica visitantes por procedencia geográfica.
-    
+    Extrae columnas como arrays numpy densos (layout SoA).
+
+    Para cálculos por registro conviene operar sobre un array homogéneo
+    y contiguo por columna, en vez de iterar filas (que materializa una
+    Series de dtype mixto por cada una).
+
+    Args:
+        df: DataFrame de origen
+        cols: Nombres de columnas a extraer
+        dtype: dtype de destino opcional (por defecto, el de cada columna)
+
+    Returns:
+        Diccionario {nombre_columna: np.ndarray}
+    """
+    return {col: df[col].to_numpy(dtype) for col in cols}
+
+
+def classify_visitor_type1(df: pd.DataFrame) -> pd.Series:
+    """
+    Clasifica visitantes por procedencia geográfica (vectorizado).
+
     Criterios:
     - Internacional: residencia = Extranjero O país != España
     - Local: residencia = España Y provincia = Valencia
     - Nacional: residencia = España Y provincia != Valencia
-    
+
+    Nota: se evalúa con máscaras booleanas y np.select en lugar de
+    apply(axis=1), evitando construir una Series por fila.
+
     Args:
-        row: Fila del DataFrame con datos de visitante
-        
+        df: DataFrame con columnas residencia, pais y provincia
+
     Returns:
-        Categoría de visitor type 1
+        Series con la categoría de visitor type 1 (NaN si no clasificable)
     """
-    if row["residencia"] == CONFIG["foreign_code"] or \
-       (pd.notna(row["pais"]) and row["pais"] != CONFIG["spain_code"]):
-        return "International"
-    elif row["residencia"] == CONFIG["spain_code"] and \
-         row["provincia"] == CONFIG["valencia_code"]:
-        return "Local"
-    elif row["residencia"] == CONFIG["spain_code"]:
-        return "National"
-    else:
-        return np.nan
-
-
-def classify_visitor_type2(row: pd.Series) -> str:
+    soa = _extract_soa(df, ["residencia", "pais", "provincia"])
+    res, pais, prov = soa["residencia"], soa["pais"], soa["provincia"]
+
+    intl = (res == CONFIG["foreign_code"]) | (pd.notna(pais) & (pais != CONFIG["spain_code"]))
+    local = (res == CONFIG["spain_code"]) & (prov == CONFIG["valencia_code"])
+    natl = (res == CONFIG["spain_code"])
+
+    # default=None mantiene dtype object para que isna() detecte los no clasificados
+    valores = np.select([intl, local, natl], ["International", "Local", "National"], default=None)
+    return pd.Series(valores, index=df.index)
+
+
+#: Etiquetas de visitor type 2 indexadas por código (3 = sin transporte)
+VT2_LABELS = np.array([
+    "Eco-conscious", "Young professional/student", "Standard", "No transport reported"
+], dtype=object)
+
+
+if HAS_NUMBA:
+    @njit(cache=True)
+    def _vt2_codes(pub, car, wb, out):
+        """Kernel numba: asigna códigos de visitor type 2 por fila.
+
+        Mismos criterios y desempates que classify_visitor_type2, pero
+        compilado a una sola pasada nativa sobre arrays int32.
+        """
+        for i in range(pub.shape[0]):
+            p, c, w = pub[i], car[i], wb[i]
+            if p == 0 and c == 0 and w == 0:
+                out[i] = 3
+            elif w >= p and w >= c:
+                out[i] = 0
+            elif p >= c:
+                out[i] = 1
+            else:
+                out[i] = 2
+
+
+def classify_visitor_type2(df: pd.DataFrame) -> pd.Series:
     """
-    Clasifica visitantes por patrón de transporte al congreso.
-    
+    Clasifica visitantes por patrón de transporte al congreso (vectorizado).
+
     Criterios (en orden de prioridad para desempates):
     1. Eco-conscious: Uso dominante de bici/pie
     2. Young professional/student: Uso dominante de transporte público
     3. Standard: Uso dominante de coche/taxi
-    
-    Nota: La jerarquía para desempates favorece opciones más sostenibles
-    
+
+    Nota: La jerarquía para desempates favorece opciones más sostenibles.
+    El orden de columnas en la matriz codifica esa jerarquía, porque
+    argmax devuelve el primer máximo.
+
     Args:
-        row: Fila del DataFrame con datos de transporte
-        
+        df: DataFrame con las columnas agregadas de transporte al congreso
+
     Returns:
-        Categoría de visitor type 2
+        Series con la categoría de visitor type 2
     """
-    public = row["public_transport_use_congreso"]
-    car = row["car_use_congreso"]
-    walk_bike = row["walk_bike_use_congreso"]
-    
+    if HAS_NUMBA:
+        # Ruta numba: pasar arrays numpy crudos (no Series) al kernel
+        soa = _extract_soa(df, [
+            "public_transport_use_congreso",
+            "car_use_congreso",
+            "walk_bike_use_congreso"
+        ], dtype=np.int32)
+        out = np.empty(len(df), np.int8)
+        _vt2_codes(
+            soa["public_transport_use_congreso"],
+            soa["car_use_congreso"],
+            soa["walk_bike_use_congreso"],
+            out
+        )
+        return pd.Series(VT2_LABELS[out], index=df.index)
+
+    arr = df[[
+        "walk_bike_use_congreso",
+        "public_transport_use_congreso",
+        "car_use_congreso"
+    ]].to_numpy()
+
+    vt2 = VT2_LABELS[:3][arr.argmax(axis=1)]
+
     # Si no hay viajes registrados
-    if public == 0 and car == 0 and walk_bike == 0:
-        return "No transport reported"
-    
-    # Determinar transporte dominante (con jerarquía para empates)
-    max_val = max(public, car, walk_bike)
-    
-    if walk_bike == max_val:
-        return "Eco-conscious"
-    elif public == max_val:
-        return "Young professional/student"
-    else:
-        return "Standard"
+    vt2[arr.sum(axis=1) == 0] = "No transport reported"
+
+    return pd.Series(vt2, index=df.index)
 
 
 def create_transport_variables(df: pd.DataFrame, context: str) -> pd.DataFrame:
@@ -195,19 +378,22 @@ def create_transport_variables(df: pd.DataFrame, context: str) -> pd.DataFrame:
     Returns:
         DataFrame con nuevas columnas de transporte agregado
     """
-    df[f"public_transport_use_{context}"] = (
-        df[f"uso_bus_{context}"].fillna(0) + 
-        df[f"uso_metro_{context}"].fillna(0)
-    )
-    df[f"car_use_{context}"] = (
-        df[f"uso_taxi_{context}"].fillna(0) + 
-        df[f"uso_coche_{context}"].fillna(0)
-    )
-    df[f"walk_bike_use_{context}"] = (
-        df[f"uso_bici_{context}"].fillna(0) + 
-        df[f"uso_pie_{context}"].fillna(0)
-    )
-    
+    # Un solo fillna sobre el bloque de 6 columnas y sumas a nivel numpy,
+    # en lugar de 6 fillna + 3 sumas por Series (cada una con su propia
+    # pasada y asignación intermedia)
+    cols = [
+        f"uso_bus_{context}", f"uso_metro_{context}",
+        f"uso_taxi_{context}", f"uso_coche_{context}",
+        f"uso_bici_{context}", f"uso_pie_{context}"
+    ]
+    # float32 basta para conteos pequeños y reduce a la mitad los bytes
+    # que mueven las reducciones groupby.mean posteriores
+    a = df[cols].fillna(0).to_numpy(dtype=np.float32)
+
+    df[f"public_transport_use_{context}"] = a[:, 0] + a[:, 1]
+    df[f"car_use_{context}"] = a[:, 2] + a[:, 3]
+    df[f"walk_bike_use_{context}"] = a[:, 4] + a[:, 5]
+
     print(f"✓ Variables de transporte creadas para contexto: {context}")
     return df
 
@@ -226,33 +412,21 @@ def create_food_variables(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         DataFrame con nuevas columnas de alimentación agregada
     """
-    # Agregación por tipo de alimento
-    food_types = {
-        "carne_roja": ["carne_roja_restaurante", "carne_roja_fastfood", 
-                       "carne_roja_domicilio", "carne_roja_casera"],
-        "avepescado": ["avepescado_restaurante", "avepescado_fastfood", 
-                       "avepescado_domicilio", "avepescado_casera"],
-        "marisco": ["marisco_restaurante", "marisco_domicilio", "marisco_casera"]
-    }
-    
-    for food_type, cols in food_types.items():
-        existing_cols = [c for c in cols if c in df.columns]
-        if existing_cols:
-            df[f"total_{food_type}"] = df[existing_cols].sum(axis=1)
-    
-    # Agregación por lugar de consumo
-    place_types = {
-        "restaurante": ["carne_roja_restaurante", "avepescado_restaurante", "marisco_restaurante"],
-        "fastfood": ["carne_roja_fastfood", "avepescado_fastfood"],
-        "domicilio": ["carne_roja_domicilio", "avepescado_domicilio", "marisco_domicilio"],
-        "casera": ["carne_roja_casera", "avepescado_casera", "marisco_casera"]
-    }
-    
-    for place, cols in place_types.items():
-        existing_cols = [c for c in cols if c in df.columns]
-        if existing_cols:
-            df[f"total_{place}"] = df[existing_cols].sum(axis=1)
-    
+    # Un solo buffer float32 contiguo con todas las columnas implicadas:
+    # una única extracción y relleno de NaN sirve para las 7 sumas,
+    # en vez de materializar un sub-DataFrame por agregación
+    all_cols = sorted(
+        (set(sum(FOOD_TYPES.values(), [])) | set(sum(PLACE_TYPES.values(), [])))
+        & set(df.columns)
+    )
+    buf = df[all_cols].to_numpy(dtype=np.float32, na_value=0.0)
+    col2i = {c: i for i, c in enumerate(all_cols)}
+
+    for name, cols in {**FOOD_TYPES, **PLACE_TYPES}.items():
+        idx = [col2i[c] for c in cols if c in col2i]
+        if idx:
+            df[f"total_{name}"] = buf[:, idx].sum(axis=1)
+
     print("✓ Variables de alimentación creadas")
     return df
 
@@ -270,23 +444,118 @@ def convert_shopping_to_numeric(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         DataFrame con columnas de compras numéricas
     """
-    shopping_cols = [
-        "compras_textiles_cantidad",
-        "compras_artesania_cantidad",
-        "compras_alimentacion_cantidad",
-        "compras_souvenirs_cantidad"
-    ]
-    
-    existing_cols = [col for col in shopping_cols if col in df.columns]
-    
-    for col in existing_cols:
-        # Convertir a numérico, tratando NaN apropiadamente
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-    
+    existing_cols = [col for col in SHOPPING_COLS if col in df.columns]
+
+    if existing_cols:
+        # Conversión en bloque: un parse por columna, pero un único
+        # relleno de NaN y un único cast sobre el buffer contiguo,
+        # en lugar de tres pasadas por columna
+        block = df[existing_cols].apply(pd.to_numeric, errors="coerce").to_numpy()
+        df[existing_cols] = np.nan_to_num(block, nan=0).astype(np.int32)
+
     print("✓ Conversión de compras a numéricas completada")
     return df
 
 
+def transform_with_polars(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ejecuta el transform fila a fila completo como plan perezoso de Polars.
+
+    Equivale a la secuencia pandas: filtrado fusionado, clasificación de
+    visitor type 1 y 2, agregados de transporte, totales de alimentación
+    y conversión de compras. Todo se expresa como expresiones sobre un
+    LazyFrame y se materializa con un único collect(), dejando que el
+    optimizador fusione filtro+proyección y paralelice entre columnas.
+
+    Args:
+        df: DataFrame crudo cargado de la encuesta
+
+    Returns:
+        DataFrame pandas filtrado y con todas las columnas derivadas,
+        con los tipos de visitante y alojamiento ya como Categorical
+    """
+    lf = pl.from_pandas(df).lazy()
+
+    # Filtrado fusionado: cuestionarios completos con alojamiento turístico.
+    # ne_missing trata los alojamientos nulos como "distinto del excluido",
+    # igual que hace la comparación NaN != str en la ruta pandas
+    lf = lf.filter(
+        (pl.col("Última página") == CONFIG["complete_survey_last_page"])
+        & pl.col("alojamiento").ne_missing(CONFIG["excluded_accommodation"])
+    )
+
+    # Agregados de transporte por contexto
+    for context in ("congreso", "ocio"):
+        lf = lf.with_columns(
+            (pl.col(f"uso_bus_{context}").fill_null(0)
+             + pl.col(f"uso_metro_{context}").fill_null(0))
+            .cast(pl.Float32).alias(f"public_transport_use_{context}"),
+            (pl.col(f"uso_taxi_{context}").fill_null(0)
+             + pl.col(f"uso_coche_{context}").fill_null(0))
+            .cast(pl.Float32).alias(f"car_use_{context}"),
+            (pl.col(f"uso_bici_{context}").fill_null(0)
+             + pl.col(f"uso_pie_{context}").fill_null(0))
+            .cast(pl.Float32).alias(f"walk_bike_use_{context}"),
+        )
+
+    # Visitor type 1: mismos criterios que classify_visitor_type1
+    lf = lf.with_columns(
+        pl.when(
+            (pl.col("residencia") == CONFIG["foreign_code"])
+            | (pl.col("pais").is_not_null() & (pl.col("pais") != CONFIG["spain_code"]))
+        ).then(pl.lit("International"))
+        .when(
+            (pl.col("residencia") == CONFIG["spain_code"])
+            & (pl.col("provincia") == CONFIG["valencia_code"])
+        ).then(pl.lit("Local"))
+        .when(pl.col("residencia") == CONFIG["spain_code"]).then(pl.lit("National"))
+        .otherwise(None)
+        .alias("visitor_type_1")
+    )
+
+    # Visitor type 2: misma jerarquía de desempates que classify_visitor_type2
+    pub = pl.col("public_transport_use_congreso")
+    car = pl.col("car_use_congreso")
+    wb = pl.col("walk_bike_use_congreso")
+    lf = lf.with_columns(
+        pl.when((pub == 0) & (car == 0) & (wb == 0)).then(pl.lit("No transport reported"))
+        .when((wb >= pub) & (wb >= car)).then(pl.lit("Eco-conscious"))
+        .when(pub >= car).then(pl.lit("Young professional/student"))
+        .otherwise(pl.lit("Standard"))
+        .alias("visitor_type_2")
+    )
+
+    # Totales de alimentación y conversión de compras
+    schema_cols = set(lf.collect_schema().names())
+    lf = lf.with_columns(
+        pl.sum_horizontal(
+            [pl.col(c).fill_null(0) for c in cols if c in schema_cols]
+        ).cast(pl.Float32).alias(f"total_{name}")
+        for name, cols in {**FOOD_TYPES, **PLACE_TYPES}.items()
+        if any(c in schema_cols for c in cols)
+    )
+    lf = lf.with_columns(
+        pl.col(c).cast(pl.Float64, strict=False).fill_null(0).cast(pl.Int32)
+        for c in SHOPPING_COLS if c in schema_cols
+    )
+
+    # Única materialización del plan
+    df_out = lf.collect().to_pandas()
+
+    # Claves de agrupación como Categorical (misma convención que la ruta pandas)
+    df_out["visitor_type_1"] = pd.Categorical(
+        df_out["visitor_type_1"], categories=CONFIG["visitor_type1_categories"]
+    )
+    df_out["visitor_type_2"] = pd.Categorical(
+        df_out["visitor_type_2"],
+        categories=CONFIG["visitor_type2_categories"] + ["No transport reported"]
+    )
+    df_out["alojamiento"] = df_out["alojamiento"].astype("category")
+
+    print(f"✓ Transform Polars materializado: {df_out.shape[0]} filas")
+    return df_out
+
+
 # %% [markdown]
 """
 ## 4. Carga y Validación de Datos
@@ -299,6 +568,16 @@ df = load_survey_data(INPUT_FILE)
 # Validar estructura
 validate_data(df)
 
+# Conversión numérica única de estancia y distancia: una sola pasada aquí
+# en lugar de duplicar el escaneo dentro de calculate_summary_metrics
+for col in ("noches_valencia", "dist_km"):
+    if col in df.columns:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+
+if "dist_km" not in df.columns:
+    print("⚠ WARNING: dist_km no encontrado en la encuesta")
+    df["dist_km"] = np.float32("nan")
+
 # Mostrar información básica
 print(f"\nInformación del dataset:")
 print(f"- Período de datos: {df['Fecha de inicio'].min()} a {df['Fecha de inicio'].max()}")
@@ -313,15 +592,26 @@ print(f"- Cuestionarios completos: {(df['Última página'] == CONFIG['complete_s
 # %%
 print("Aplicando filtros...")
 
-# Filtrar cuestionarios completos
-df_filtered = df[df["Última página"] == CONFIG["complete_survey_last_page"]].copy()
-print(f"✓ Cuestionarios completos: {df_filtered.shape[0]}")
+if USE_POLARS and HAS_POLARS:
+    # Ruta Polars: el filtrado y todas las columnas derivadas se evalúan
+    # como un único plan perezoso (las celdas pandas siguientes se saltan)
+    df_filtered = transform_with_polars(df)
+else:
+    # Máscara combinada: cuestionarios completos + visitantes con alojamiento
+    # (excluir locales que no pernoctan). Fusionar ambas condiciones evita una
+    # segunda indexación booleana con su copia intermedia
+    mask_completos = df["Última página"] == CONFIG["complete_survey_last_page"]
+    mask_alojamiento = df["alojamiento"] != CONFIG["excluded_accommodation"]
+
+    df_filtered = df.loc[mask_completos & mask_alojamiento].copy()
+    df_filtered = df_filtered.reset_index(drop=True)
 
-# Filtrar visitantes con alojamiento (excluir locales que no pernoctan)
-df_filtered = df_filtered[
-    df_filtered["alojamiento"] != CONFIG["excluded_accommodation"]
-]
-print(f"✓ Con alojamiento turístico: {df_filtered.shape[0]}")
+    print(f"✓ Cuestionarios completos: {int(mask_completos.sum())}")
+    print(f"✓ Con alojamiento turístico: {df_filtered.shape[0]}")
+
+    # Alojamiento como Categorical (categorías inferidas) para abaratar los
+    # groupby/pivot que lo usan como clave
+    df_filtered["alojamiento"] = df_filtered["alojamiento"].astype("category")
 
 # Verificar que quedan datos suficientes
 if df_filtered.shape[0] < 10:
@@ -334,11 +624,18 @@ if df_filtered.shape[0] < 10:
 
 # %%
 # Clasificar visitor type 1 (procedencia geográfica)
-df_filtered["visitor_type_1"] = df_filtered.apply(classify_visitor_type1, axis=1)
+# Como Categorical: los groupby posteriores agrupan sobre códigos enteros
+# en lugar de hashear strings fila a fila
+if not (USE_POLARS and HAS_POLARS):
+    df_filtered["visitor_type_1"] = pd.Categorical(
+        classify_visitor_type1(df_filtered),
+        categories=CONFIG["visitor_type1_categories"]
+    )
 
-print("\nDistribución de Visitor Type 1:")
-print(df_filtered["visitor_type_1"].value_counts())
-print(f"\nValores faltantes: {df_filtered['visitor_type_1'].isna().sum()}")
+if VERBOSE:
+    print("\nDistribución de Visitor Type 1:")
+    print(df_filtered["visitor_type_1"].value_counts())
+    print(f"\nValores faltantes: {df_filtered['visitor_type_1'].isna().sum()}")
 
 # Verificar que la columna se creó correctamente
 assert "visitor_type_1" in df_filtered.columns, "Error: visitor_type_1 no se creó"
@@ -346,8 +643,9 @@ print(f"✓ Columna visitor_type_1 creada correctamente")
 
 # %%
 # Crear variables de transporte
-df_filtered = create_transport_variables(df_filtered, "congreso")
-df_filtered = create_transport_variables(df_filtered, "ocio")
+if not (USE_POLARS and HAS_POLARS):
+    df_filtered = create_transport_variables(df_filtered, "congreso")
+    df_filtered = create_transport_variables(df_filtered, "ocio")
 
 # Verificar que las columnas de transporte existen
 required_transport_cols = [
@@ -361,11 +659,16 @@ for col in required_transport_cols:
 print(f"✓ Todas las columnas de transporte creadas")
 
 # Clasificar visitor type 2 (patrón de transporte)
-df_filtered["visitor_type_2"] = df_filtered.apply(classify_visitor_type2, axis=1)
+if not (USE_POLARS and HAS_POLARS):
+    df_filtered["visitor_type_2"] = pd.Categorical(
+        classify_visitor_type2(df_filtered),
+        categories=CONFIG["visitor_type2_categories"] + ["No transport reported"]
+    )
 
-print("\nDistribución de Visitor Type 2:")
-print(df_filtered["visitor_type_2"].value_counts())
-print(f"\nValores faltantes: {df_filtered['visitor_type_2'].isna().sum()}")
+if VERBOSE:
+    print("\nDistribución de Visitor Type 2:")
+    print(df_filtered["visitor_type_2"].value_counts())
+    print(f"\nValores faltantes: {df_filtered['visitor_type_2'].isna().sum()}")
 
 # Verificar que la columna se creó correctamente
 assert "visitor_type_2" in df_filtered.columns, "Error: visitor_type_2 no se creó"
@@ -378,11 +681,12 @@ print(f"✓ Columna visitor_type_2 creada correctamente")
 """
 
 # %%
-# Variables de alimentación
-df_filtered = create_food_variables(df_filtered)
+if not (USE_POLARS and HAS_POLARS):
+    # Variables de alimentación
+    df_filtered = create_food_variables(df_filtered)
 
-# Variables de compras
-df_filtered = convert_shopping_to_numeric(df_filtered)
+    # Variables de compras
+    df_filtered = convert_shopping_to_numeric(df_filtered)
 
 print("\n✓ Todas las variables agregadas creadas exitosamente")
 
@@ -402,54 +706,47 @@ def calculate_summary_metrics(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         DataFrame con métricas agregadas
     """
-    # Convertir noches_valencia a numérico (excluyendo valores problemáticos)
-    df["noches_valencia_num"] = pd.to_numeric(df["noches_valencia"], errors='coerce')
-    
-    # Convertir dist_km a numérico si no lo es
-    if "dist_km" in df.columns:
-        df["dist_km_num"] = pd.to_numeric(df["dist_km"], errors='coerce')
-        print(f"  ✓ dist_km convertido a numérico: {df['dist_km_num'].notna().sum()} valores válidos")
-    else:
-        print("  ⚠️ WARNING: dist_km no encontrado en DataFrame")
-        df["dist_km_num"] = np.nan
-    
-    # Agrupar por visitor type 1 y 2
-    summary = (
-        df.groupby(["visitor_type_1", "visitor_type_2"])
-        .agg(
-            count_visitors=("visitor_type_1", "size"),
-            avg_nights=("noches_valencia_num", "mean"),
-            avg_public_transport_congress=("public_transport_use_congreso", "mean"),
-            avg_car_congress=("car_use_congreso", "mean"),
-            avg_walk_bike_congress=("walk_bike_use_congreso", "mean"),
-            avg_public_transport_leisure=("public_transport_use_ocio", "mean"),
-            avg_car_leisure=("car_use_ocio", "mean"),
-            avg_walk_bike_leisure=("walk_bike_use_ocio", "mean"),
-            avg_red_meat=("total_carne_roja", "mean"),
-            avg_poultry_fish=("total_avepescado", "mean"),
-            avg_seafood=("total_marisco", "mean"),
-            avg_restaurant=("total_restaurante", "mean"),
-            avg_fastfood=("total_fastfood", "mean"),
-            avg_delivery=("total_domicilio", "mean"),
-            avg_homemade=("total_casera", "mean"),
-            dist_km_congress=("dist_km_num", "mean")  # CAMBIO: Usar dist_km_num y renombrar
-        )
-        .reset_index()
-    )
+    # noches_valencia y dist_km ya llegan como float32 desde la carga
+    # (ver sección 4), así que no hace falta reconvertir aquí
+
+    # Agrupar por visitor type 1 y 2: una sola agrupación reutilizada para
+    # todas las medias (ruta cythonizada) más un size() para el conteo
+    mean_cols = {
+        "noches_valencia": "avg_nights",
+        "public_transport_use_congreso": "avg_public_transport_congress",
+        "car_use_congreso": "avg_car_congress",
+        "walk_bike_use_congreso": "avg_walk_bike_congress",
+        "public_transport_use_ocio": "avg_public_transport_leisure",
+        "car_use_ocio": "avg_car_leisure",
+        "walk_bike_use_ocio": "avg_walk_bike_leisure",
+        "total_carne_roja": "avg_red_meat",
+        "total_avepescado": "avg_poultry_fish",
+        "total_marisco": "avg_seafood",
+        "total_restaurante": "avg_restaurant",
+        "total_fastfood": "avg_fastfood",
+        "total_domicilio": "avg_delivery",
+        "total_casera": "avg_homemade",
+        "dist_km": "dist_km_congress"
+    }
 
-   
-    
- # Calcular porcentajes
+    gb = df.groupby(["visitor_type_1", "visitor_type_2"], observed=True, sort=False)
+    summary = gb[list(mean_cols)].mean().rename(columns=mean_cols)
+    summary["count_visitors"] = gb.size()
+    summary = summary.reset_index()
+
+    # Calcular porcentajes reutilizando los conteos ya agrupados: la suma
+    # de count_visitors por tipo 1 equivale al value_counts sobre df, así
+    # que no hace falta volver a escanear el frame filtrado
     total_visitors = df.shape[0]
-    type1_counts = df["visitor_type_1"].value_counts()
-    summary["pct_visitor_type_1"] = (
-        summary["visitor_type_1"].map(type1_counts) / total_visitors * 100
-    ).round(2)
-    
+    type1_totals = (
+        summary.groupby("visitor_type_1", observed=True)["count_visitors"]
+        .transform("sum")
+    )
+    summary["pct_visitor_type_1"] = (type1_totals / total_visitors * 100).round(2)
+
     # Porcentaje dentro de cada tipo 1
     summary["pct_visitor_type_2"] = (
-        summary.groupby("visitor_type_1")["count_visitors"]
-        .transform(lambda x: x / x.sum() * 100)
+        summary["count_visitors"] / type1_totals * 100
     ).round(2)
     
     return summary
@@ -469,9 +766,10 @@ else:
     print("  ❌ ERROR: dist_km_congress NO se creó")
     print(f"  Columnas disponibles: {summary_df.columns.tolist()}")
 
-print("\nResumen de métricas calculadas:")
-print(summary_df[["visitor_type_1", "visitor_type_2", "count_visitors", 
-                  "pct_visitor_type_1", "pct_visitor_type_2"]].to_string())
+if VERBOSE:
+    print("\nResumen de métricas calculadas:")
+    print(summary_df[["visitor_type_1", "visitor_type_2", "count_visitors",
+                      "pct_visitor_type_1", "pct_visitor_type_2"]].to_string())
 
 # %% [markdown]
 """
@@ -481,108 +779,44 @@ print(summary_df[["visitor_type_1", "visitor_type_2", "count_visitors",
 # %%
 def add_accommodation_metrics(df: pd.DataFrame, summary: pd.DataFrame) -> pd.DataFrame:
     """
-    Añade métricas promedio de noches por tipo de alojamiento.
-    
+    Añade métricas promedio de noches por categoría de alojamiento.
+
+    Cada fila se enruta a su categoría consolidada (ACCOMMODATION_BUCKETS)
+    antes de agregar, de modo que un único pivot produce directamente las
+    columnas finales. El promedio resultante es ponderado por visitante,
+    no un promedio de promedios por tipo individual.
+
     Args:
         df: DataFrame filtrado con datos completos
         summary: DataFrame con métricas agregadas
-        
+
     Returns:
-        DataFrame summary con columnas de alojamiento
+        DataFrame summary con columnas de alojamiento agrupadas
     """
-    # Calcular promedio de noches por tipo de alojamiento
-    accommodation_avg = (
-        df.groupby(["visitor_type_1", "visitor_type_2", "alojamiento"])
-        ["noches_valencia_num"]
-        .mean()
-        .reset_index()
+    # pivot_table fusiona el groupby y el pivot en una sola agregación,
+    # y el join por índice evita el merge sobre dos columnas de strings.
+    # map sobre Categorical solo recorre las categorías, no las filas
+    df = df.assign(
+        _bucket=df["alojamiento"].map(lambda a: ACCOMMODATION_BUCKETS.get(a, a))
     )
-    
-    # Pivotar para tener columnas por tipo de alojamiento
-    accommodation_pivot = accommodation_avg.pivot(
+    accommodation_pivot = pd.pivot_table(
+        df,
+        values="noches_valencia",
         index=["visitor_type_1", "visitor_type_2"],
-        columns="alojamiento",
-        values="noches_valencia_num"
-    ).reset_index()
-    
-    # Renombrar columnas
-    accommodation_pivot.columns = [
-        f"avg_nights_{col}" if col not in ["visitor_type_1", "visitor_type_2"] else col
-        for col in accommodation_pivot.columns
-    ]
-    
-    # Merge con summary
-    summary = pd.merge(
-        summary,
-        accommodation_pivot,
-        on=["visitor_type_1", "visitor_type_2"],
-        how="left"
+        columns="_bucket",
+        aggfunc="mean",
+        observed=True
     )
-    
+    accommodation_pivot.columns = [f"avg_nights_{col}" for col in accommodation_pivot.columns]
+
+    summary = summary.join(accommodation_pivot, on=["visitor_type_1", "visitor_type_2"])
+
     print("✓ Métricas de alojamiento añadidas")
     return summary
 
 
 summary_df = add_accommodation_metrics(df_filtered, summary_df)
 
-def group_accommodation_categories(summary: pd.DataFrame) -> pd.DataFrame:
-    """
-    Agrupa tipos de alojamiento en categorías consolidadas.
-    
-    Agrupaciones:
-    - 
-    - Airbnb: Alojamiento local sin coste + Apartamento de alquiler (AirBnb)
-    - Hotel 3 estrellas: Hotel 3 estrellas
-    - Hotel 4 estrellas: Hotel 4 estrellas
-    - Hotel 5 estrellas: Hotel 5 estrellas  
-    - Pensión o Hostal: Hotel 2 estrellas + Pensión o hostal
-    
-    Args:
-        summary: DataFrame con métricas de alojamiento individuales
-        
-    Returns:
-        DataFrame con columnas de alojamiento agrupadas
-    """
-    # Mapeo de columnas originales (ajustar nombres según tus datos reales)
-    groupings = {
-        "avg_nights_Airbnb": [
-            "avg_nights_Alojamiento local sin coste",
-            "avg_nights_Apartamento de alquiler (AirBnb)"
-        ],
-        "avg_nights_Hotel 3 estrellas": [
-            "avg_nights_Hotel 3 estrellas"
-        ],
-        "avg_nights_Hotel 4 estrellas": [
-            "avg_nights_Hotel 4 estrellas"
-        ],
-        "avg_nights_Hotel 5 estrellas": [
-            "avg_nights_Hotel 5 estrellas"
-        ],
-        "avg_nights_Pension o Hostal": [
-            "avg_nights_Hotel 2 estrellas",
-            "avg_nights_Pensión o hostal"
-        ]
-    }
-    
-    # Crear nuevas columnas agrupadas
-    for new_col, source_cols in groupings.items():
-        # Filtrar columnas que existen en el DataFrame
-        existing_cols = [col for col in source_cols if col in summary.columns]
-        
-        if existing_cols:
-            # Sumar/promediar las columnas existentes (usando mean porque son promedios)
-            # Si quieres suma ponderada, necesitarías los counts
-            summary[new_col] = summary[existing_cols].mean(axis=1)
-        else:
-            # Si no existen, crear columna con NaN
-            summary[new_col] = np.nan
-    
-    print("✓ Categorías de alojamiento agrupadas")
-    print(f"  Nuevas columnas creadas: {list(groupings.keys())}")
-    
-    return summary
-
-summary_df = group_accommodation_categories(summary_df)
 # %% [markdown]
 """
 ## 10. Añadir Métricas de Compras
@@ -600,22 +834,15 @@ def add_shopping_metrics(df: pd.DataFrame, summary: pd.DataFrame) -> pd.DataFram
     Returns:
         DataFrame summary con columnas de compras
     """
-    shopping_cols = [
-        "compras_textiles_cantidad",
-        "compras_artesania_cantidad",
-        "compras_alimentacion_cantidad",
-        "compras_souvenirs_cantidad"
-    ]
-    
-    existing_cols = [col for col in shopping_cols if col in df.columns]
-    
+    existing_cols = [col for col in SHOPPING_COLS if col in df.columns]
+
     if not existing_cols:
         print("⚠ No se encontraron columnas de compras")
         return summary
     
     # Calcular promedios
     shopping_avg = (
-        df.groupby(["visitor_type_1", "visitor_type_2"])
+        df.groupby(["visitor_type_1", "visitor_type_2"], observed=True, sort=False)
         [existing_cols]
         .mean()
         .reset_index()
@@ -658,18 +885,21 @@ def complete_visitor_matrix(summary: pd.DataFrame) -> pd.DataFrame:
     Returns:
         DataFrame con todas las combinaciones posibles
     """
-    # Crear MultiIndex con todas las combinaciones
-    all_combinations = pd.MultiIndex.from_product(
+    # Andamiaje con las 3x3 combinaciones, con los mismos dtypes
+    # categóricos que summary para que el merge compare códigos enteros.
+    # Un left-join sobre 9 filas evita reconstruir el MultiIndex de summary
+    scaffold = pd.DataFrame(
         [
-            CONFIG["visitor_type1_categories"],
-            CONFIG["visitor_type2_categories"]
+            (vt1, vt2)
+            for vt1 in CONFIG["visitor_type1_categories"]
+            for vt2 in CONFIG["visitor_type2_categories"]
         ],
-        names=["visitor_type_1", "visitor_type_2"]
+        columns=["visitor_type_1", "visitor_type_2"]
     )
-    
-    # Reindexar
-    summary = summary.set_index(["visitor_type_1", "visitor_type_2"])
-    summary = summary.reindex(all_combinations).reset_index()
+    for col in ("visitor_type_1", "visitor_type_2"):
+        scaffold[col] = scaffold[col].astype(summary[col].dtype)
+
+    summary = scaffold.merge(summary, on=["visitor_type_1", "visitor_type_2"], how="left")
     
     # Los count_visitors sin datos deberían ser 0
     summary["count_visitors"] = summary["count_visitors"].fillna(0)
@@ -752,21 +982,22 @@ for vtype in CONFIG["visitor_type1_categories"]:
     print(f"  - {vtype}: {int(total_visitors)} visitantes ({count} subcategorías)")
 
 print(f"\n📈 Métricas calculadas:")
-print(f"  - Promedio de noches (general): {df_filtered['noches_valencia_num'].mean():.2f}")
+print(f"  - Promedio de noches (general): {df_filtered['noches_valencia'].mean():.2f}")
 print(f"  - Uso promedio transporte público: {df_filtered['public_transport_use_congreso'].mean():.2f}")
 print(f"  - Uso promedio coche: {df_filtered['car_use_congreso'].mean():.2f}")
 print(f"  - Uso promedio bici/pie: {df_filtered['walk_bike_use_congreso'].mean():.2f}")
 
-if 'dist_km_num' in df_filtered.columns:
-    print(f"  - Distancia promedio al congreso: {df_filtered['dist_km_num'].mean():.2f} km")
+if 'dist_km' in df_filtered.columns:
+    print(f"  - Distancia promedio al congreso: {df_filtered['dist_km'].mean():.2f} km")
 
 print(f"\n✓ Procesamiento completado exitosamente")
 
 # Mostrar primeras filas del resultado
-print("\n" + "=" * 60)
-print("VISTA PREVIA DEL RESULTADO")
-print("=" * 60)
-display(summary_df.head(10))
+if VERBOSE:
+    print("\n" + "=" * 60)
+    print("VISTA PREVIA DEL RESULTADO")
+    print("=" * 60)
+    display(summary_df.head(10))
 
 # %% [markdown]
 """
@@ -785,8 +1016,20 @@ def export_results(summary: pd.DataFrame, full_data: pd.DataFrame, output_path:
     """
     # Crear directorio si no existe
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    
-    with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
+
+    # xlsxwriter serializa más rápido que openpyxl; mantener openpyxl
+    # como fallback si no está instalado. Ojo: no usar constant_memory,
+    # ese modo exige escribir las filas en orden y to_excel emite las
+    # celdas por columnas, lo que descartaría casi toda la hoja
+    engine = "openpyxl"
+    if FAST_IO:
+        try:
+            import xlsxwriter  # noqa: F401
+            engine = "xlsxwriter"
+        except ImportError:
+            print("⚠ xlsxwriter no instalado, usando openpyxl")
+
+    with pd.ExcelWriter(output_path, engine=engine) as writer:
         # Hoja 1: Resumen agregado
         summary.to_excel(writer, sheet_name="visitor_summary", index=False)
         
@@ -813,7 +1056,22 @@ def export_results(summary: pd.DataFrame, full_data: pd.DataFrame, output_path:
             ]
         })
         metadata.to_excel(writer, sheet_name="metadata", index=False)
-    
+
+    # Persistir también en Parquet (columnar y comprimido) para pipelines
+    # posteriores que no necesiten pasar por Excel. Mejor esfuerzo: una
+    # copia opcional fallida no debe abortar la exportación (el xlsx ya
+    # está escrito en este punto)
+    if FAST_IO:
+        try:
+            summary.to_parquet(output_path.with_suffix(".parquet"), index=False)
+            full_data.to_parquet(
+                output_path.with_name(f"{output_path.stem}_full_data.parquet"),
+                index=False
+            )
+            print(f"✓ Copias Parquet escritas junto a {output_path.name}")
+        except Exception as e:
+            print(f"⚠ No se pudo escribir la copia Parquet, se omite: {e}")
+
     print(f"\n✓ Resultados exportados a: {output_path}")
     print(f"  - Hojas creadas: visitor_summary, full_data, metadata")
 